@@ -3,11 +3,35 @@
 from datasets import load_dataset
 from datetime import datetime
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from sentence_transformers.util import batch_to_device
 from tqdm import tqdm
+import numpy as np
 import pandas as pd
+import torch
+import math
+import queue
+import random
+import threading
+import time
 from collections import defaultdict
 
+# full pass runs as prefetch → tokenize → infer → aggregate threads
+PIPE_BATCH   = 64      # speeches per batch handed between stages
+PIPE_QSIZE   = 4       # batches buffered between stages (backpressure)
+
+# sampling mode: score a per-month random sample instead of every speech
+SAMPLE_MODE  = False
+SAMPLE_K     = 400     # reservoir size per month (upper bound on speeches embedded)
+SAMPLE_BATCH = 32      # speeches embedded between CI checks
+SAMPLE_SEED  = 1910
+MIN_SAMPLES  = 30      # never stop a month before this many samples
+CI_WIDTH     = 0.01    # stop once every dim's CI is narrower than this
+CI_Z         = 1.96    # 95% normal interval
+
+# anchor robustness: leave-one-item-out and bootstrap variants (full pass only)
+N_BOOT       = 200     # bootstrap resamples of each dim's items
+BOOT_SEED    = 1910
+
 # def pos/neg items for each dimension
 dimensions = {
     "liberty": (
@@ -143,22 +167,43 @@ dimensions = {
 # load SBERT model and build anchors
 model = SentenceTransformer("sentence-transformers/all-MiniLM-L12-v2")
 anchors = {}
+item_emb = []   # every pos/neg item, dim by dim, pos before neg
 for dim, (pos_items, neg_items) in dimensions.items():
     pos_emb = model.encode(pos_items, convert_to_numpy=True)
     neg_emb = model.encode(neg_items, convert_to_numpy=True)
     anchors[dim] = pos_emb.mean(axis=0) - neg_emb.mean(axis=0)
+    item_emb.extend(pos_emb); item_emb.extend(neg_emb)
+item_mat = np.stack(item_emb)
 
-# prep monthly aggregator
-agg = defaultdict(lambda: {d: [0.0, 0] for d in anchors})
+def anchor_variants():
+    """Unit-norm weight rows over item_mat for each dim's anchor variants.
 
-# prep. Stream & score
-ds = load_dataset(
-    "Eugleo/us-congressional-speeches-subset",
-    split="train",
-    streaming=True
-)
+    Any anchor built from item means is w @ item_mat, so a speech's cosine
+    to it is (speech_hat @ item_mat.T) @ w / |w @ item_mat|.  Returns
+    {dim: {"full": w, "loo": W, "boot": W}} with rows pre-divided by that norm."""
+    rng = np.random.default_rng(BOOT_SEED)
+    out, off = {}, 0
+    for dim, (pos_items, neg_items) in dimensions.items():
+        p, n = len(pos_items), len(neg_items)
+
+        def weights(pos_cnt, neg_cnt):
+            w = np.zeros(len(item_mat))
+            w[off:off + p] = pos_cnt / pos_cnt.sum()
+            w[off + p:off + p + n] = -neg_cnt / neg_cnt.sum()
+            return w / np.linalg.norm(w @ item_mat)
+
+        loo = ([weights(1 - np.eye(p)[i], np.ones(n)) for i in range(p)] +
+               [weights(np.ones(p), 1 - np.eye(n)[i]) for i in range(n)])
+        boot = [weights(np.bincount(rng.integers(p, size=p), minlength=p).astype(float),
+                        np.bincount(rng.integers(n, size=n), minlength=n).astype(float))
+                for _ in range(N_BOOT)]
+        out[dim] = {"full": weights(np.ones(p), np.ones(n)),
+                    "loo": np.stack(loo), "boot": np.stack(boot)}
+        off += p + n
+    return out
 
-for ex in tqdm(ds, total=5038919, desc="Streaming & scoring"):
+def parse_record(ex):
+    """Return (month, text) for a usable speech, or None if it is filtered out."""
     raw_date = ex["date"]
     # parse date
     if isinstance(raw_date, str):
@@ -170,34 +215,226 @@ for ex in tqdm(ds, total=5038919, desc="Streaming & scoring"):
         dt = raw_date
     # filter years
     if dt.year < 1910 or dt.year > 2020:
-        continue
+        return None
     # drop only truly "Unknown"
     if ex.get("speaker") == "Unknown":
-        continue
+        return None
 
-    month = dt.strftime("%Y-%m")
     text = ex.get("text", "")
     if not text:
-        continue
+        return None
+    return dt.strftime("%Y-%m"), text
+
+# prep monthly aggregator
+agg = defaultdict(lambda: {d: [0.0, 0] for d in anchors})
+item_agg = defaultdict(lambda: [np.zeros(len(item_mat)), 0])   # full pass: summed item sims
+dims = list(anchors)
+anchor_mat = np.stack([anchors[d] / np.linalg.norm(anchors[d]) for d in dims])
+
+_DONE = object()
+
+class Stage(threading.Thread):
+    """One pipeline stage: pull from `src` (queue or iterator), apply `fn`, push to `dst`.
+
+    Records time spent working (busy), waiting on upstream (starved) and
+    waiting on a full downstream queue (blocked)."""
+    def __init__(self, name, fn, src, dst=None):
+        super().__init__(name=name, daemon=True)
+        self.fn, self.src, self.dst = fn, src, dst
+        self.busy = self.starved = self.blocked = 0.0
+        self.batches, self.error = 0, None
+
+    def _pull(self):
+        if isinstance(self.src, queue.Queue):
+            return self.src.get()
+        return next(self.src, _DONE)
+
+    def run(self):
+        try:
+            while True:
+                t0 = time.perf_counter()
+                item = self._pull()
+                t1 = time.perf_counter()
+                # pulling from the raw iterator *is* the prefetch stage's work
+                if isinstance(self.src, queue.Queue):
+                    self.starved += t1 - t0
+                else:
+                    self.busy += t1 - t0
+                if item is _DONE:
+                    break
+                out = self.fn(item)
+                t2 = time.perf_counter()
+                self.busy += t2 - t1
+                if self.dst is not None:
+                    self.dst.put(out)
+                    self.blocked += time.perf_counter() - t2
+                self.batches += 1
+        except BaseException as e:
+            self.error = e
+        finally:
+            if self.dst is not None:
+                self.dst.put(_DONE)
+
+def prefetch_batches(ds):
+    """Yield (months, texts) batches of PIPE_BATCH usable speeches from the stream."""
+    months, texts = [], []
+    for ex in tqdm(ds, total=5038919, desc="Streaming & scoring"):
+        rec = parse_record(ex)
+        if rec is None:
+            continue
+        months.append(rec[0]); texts.append(rec[1])
+        if len(texts) == PIPE_BATCH:
+            yield months, texts
+            months, texts = [], []
+    if texts:
+        yield months, texts
+
+def tokenize_batch(batch):
+    months, texts = batch
+    return months, model.tokenize(texts)
+
+def infer_batch(batch):
+    months, features = batch
+    with torch.inference_mode():
+        out = model(batch_to_device(features, model.device))
+    return months, out["sentence_embedding"].float().cpu().numpy()
+
+def aggregate_batch(batch):
+    months, emb = batch
+    # similarity to every anchor item; anchor variants are derived afterwards
+    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    for month, sims in zip(months, emb @ item_mat.T):
+        item_agg[month][0] += sims
+        item_agg[month][1] += 1
+
+def run_pipeline(ds):
+    """Score the full stream through bounded queues; print per-stage utilization."""
+    q_text, q_tok, q_emb = (queue.Queue(maxsize=PIPE_QSIZE) for _ in range(3))
+    stages = [
+        Stage("prefetch", lambda b: b, prefetch_batches(ds), q_text),
+        Stage("tokenize", tokenize_batch, q_text, q_tok),
+        Stage("infer", infer_batch, q_tok, q_emb),
+        Stage("aggregate", aggregate_batch, q_emb),
+    ]
+    start = time.perf_counter()
+    for st in stages:
+        st.start()
+    stages[-1].join()
+    # a failed stage leaves upstream threads blocked on put, so don't join them
+    for st in stages:
+        if st.error is not None:
+            raise RuntimeError(f"pipeline stage '{st.name}' failed") from st.error
+    for st in stages[:-1]:
+        st.join()
+    wall = time.perf_counter() - start
+
+    print(f"\nPipeline utilization over {wall:,.0f}s ({stages[-1].batches:,} batches)")
+    for st in stages:
+        print(f"  {st.name:<10} busy {st.busy / wall:6.1%}   "
+              f"starved {st.starved / wall:6.1%}   blocked {st.blocked / wall:6.1%}")
+    print(f"  bottleneck: {max(stages, key=lambda st: st.busy).name}")
+
+# prep. Stream & score
+ds = load_dataset(
+    "Eugleo/us-congressional-speeches-subset",
+    split="train",
+    streaming=True
+)
+
+if not SAMPLE_MODE:
+    run_pipeline(ds)
+
+    # month means are linear in the item sims, so every variant is one dot product
+    variants = anchor_variants()
+    for month, (tot, cnt) in item_agg.items():
+        mean_sims = tot / cnt
+        for dim, v in variants.items():
+            agg[month][dim] = [float(v["full"] @ mean_sims) * cnt, cnt,
+                               v["loo"] @ mean_sims, v["boot"] @ mean_sims]
+
+    # keep the item sims so further variants don't need another pass
+    months = sorted(item_agg)
+    np.savez("monthly_item_sims_1910_2020.npz",
+             months=np.array(months),
+             mean_sims=np.stack([item_agg[m][0] / item_agg[m][1] for m in months]),
+             counts=np.array([item_agg[m][1] for m in months]),
+             item_dims=np.array([d for d, (pos, neg) in dimensions.items()
+                                 for _ in pos + neg]))
 
-    # embed once
-    emb = model.encode([text], convert_to_numpy=True)[0]
+else:
+    def score_month(month, texts, N):
+        """Embed a month's sample in random order until every CI is tight enough."""
+        rng.shuffle(texts)
+        n, mean, m2 = 0, np.zeros(len(dims)), np.zeros(len(dims))
+        half = np.full(len(dims), np.inf)
+        for i in range(0, len(texts), SAMPLE_BATCH):
+            emb = model.encode(texts[i:i + SAMPLE_BATCH], convert_to_numpy=True,
+                               normalize_embeddings=True)
+            # running mean / variance (Welford)
+            for sims in emb @ anchor_mat.T:
+                n += 1
+                delta = sims - mean
+                mean += delta / n
+                m2 += delta * (sims - mean)
+            if n == N:
+                half = np.zeros(len(dims))
+            elif n > 1:
+                fpc = math.sqrt((N - n) / (N - 1))    # finite-population correction
+                half = CI_Z * np.sqrt(m2 / (n - 1) / n) * fpc
+            if n >= MIN_SAMPLES and 2 * half.max() <= CI_WIDTH:
+                break
+        for j, dim in enumerate(dims):
+            agg[month][dim] = [mean[j] * n, n, half[j]]
+        agg[month]["_total"] = N
 
-    # compute and accumulate each sim
-    for dim, anchor in anchors.items():
-        sim = cosine_similarity(emb.reshape(1, -1),
-                                anchor.reshape(1, -1))[0, 0]
-        agg[month][dim][0] += sim
-        agg[month][dim][1] += 1
+    # stratified reservoir per month. The stream is date-ordered, so a month's
+    # reservoir is scored and freed as soon as the stream moves past it; only
+    # the current month's SAMPLE_K texts are ever held in memory.
+    rng = random.Random(SAMPLE_SEED)
+    reservoir, seen, late = {}, defaultdict(int), 0
+    for ex in tqdm(ds, total=5038919, desc="Streaming & sampling"):
+        rec = parse_record(ex)
+        if rec is None:
+            continue
+        month, text = rec
+        if month in agg:          # month already scored – can't join its sample
+            late += 1
+            continue
+        for done in [m for m in reservoir if m != month]:
+            score_month(done, reservoir.pop(done), seen[done])
+        seen[month] += 1
+        res = reservoir.setdefault(month, [])
+        if len(res) < SAMPLE_K:
+            res.append(text)
+        elif (j := rng.randrange(seen[month])) < SAMPLE_K:
+            res[j] = text
+    for done in list(reservoir):
+        score_month(done, reservoir.pop(done), seen[done])
+    if late:
+        print(f"! {late:,} speeches arrived after their month was scored – not sampled")
 
 # 5. Build summar y DataFrame
 rows = []
 for month, metrics in agg.items():
     row = {"month": month}
-    for dim, (tot, cnt) in metrics.items():
+    for dim in anchors:
+        tot, cnt = metrics[dim][:2]
         row[f"{dim}_avg"] = (tot / cnt) if cnt > 0 else None
+        if SAMPLE_MODE:
+            half = metrics[dim][2]
+            row[f"{dim}_ci_lo"] = row[f"{dim}_avg"] - half
+            row[f"{dim}_ci_hi"] = row[f"{dim}_avg"] + half
+        else:
+            loo, boot = metrics[dim][2:]
+            row[f"{dim}_loo_min"], row[f"{dim}_loo_max"] = loo.min(), loo.max()
+            row[f"{dim}_boot_lo"], row[f"{dim}_boot_hi"] = np.percentile(boot, [2.5, 97.5])
+    if SAMPLE_MODE:
+        row["n_sampled"] = cnt
+        row["n_total"] = metrics["_total"]
     rows.append(row)
 
+out_csv = ("monthly_ccr_scores_1910_2020_sampled.csv" if SAMPLE_MODE
+           else "monthly_ccr_scores_1910_2020.csv")
 df = pd.DataFrame(rows).sort_values("month")
-df.to_csv("monthly_ccr_scores_1910_2020.csv", index=False)
-print("✓ Saved monthly CCR scores → monthly_ccr_scores_1910_2020.csv")
+df.to_csv(out_csv, index=False)
+print(f"✓ Saved monthly CCR scores → {out_csv}")
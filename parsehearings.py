@@ -6,7 +6,7 @@
 #      • parse all XMLs (not just substantive ones)
 #      • maintains rerun capability
 # ───────
-import json, re, itertools, gc, lxml.etree as ET, pandas as pd
+import json, re, itertools, gc, zlib, lxml.etree as ET, numpy as np, pandas as pd
 from pathlib import Path
 from datetime import date
 import signal  #need this to help rerun the script when TDM studio kicks me off
@@ -24,6 +24,15 @@ SELECTED   = OUT_DIR / "selected_xmls.json"
 OUT_CLEAN  = OUT_DIR / "selected_hearings_clean.csv"
 OUT_DROP   = OUT_DIR / "selected_hearings_discarded.csv"
 OUT_NO_INT = OUT_DIR / "selected_no_intro.csv"
+OUT_DUPES  = OUT_DIR / "selected_duplicates.csv"
+SIG_INDEX  = OUT_DIR / "minhash_index.jsonl"
+
+# near-duplicate screen (reprints / multi-part volumes)
+DEDUP_KB   = 64      # only fingerprint the first N KB of Text
+SHINGLE_K  = 5       # word k-grams
+NUM_PERM   = 128     # MinHash signature length
+LSH_BANDS  = 32      # NUM_PERM must divide evenly into bands
+DUP_THRESH = 0.85    # estimated Jaccard above which a file is a duplicate
 
 dash = "─"*110
 log  = print
@@ -244,19 +253,91 @@ def scrub_artifacts(txt:str)->str:
 
 word_pat=re.compile(r"[A-Za-z0-9]")
 
+# ── near-duplicate fingerprints (MinHash + LSH) ─────
+_MERSENNE = (1 << 61) - 1
+_rng      = np.random.RandomState(1873)      # fixed seed → signatures stable across reruns
+_PERM_A   = _rng.randint(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_PERM_B   = _rng.randint(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+_ROWS     = NUM_PERM // LSH_BANDS
+
+def minhash(txt: str):
+    """MinHash signature over word shingles of the first DEDUP_KB of *txt* (None if too short)."""
+    words = re.findall(r"[a-z0-9]+", txt[:DEDUP_KB * 1024].lower())
+    if len(words) < SHINGLE_K:
+        return None
+    shingles = {zlib.crc32(" ".join(words[i:i + SHINGLE_K]).encode())
+                for i in range(len(words) - SHINGLE_K + 1)}
+    h = np.fromiter(shingles, dtype=np.uint64)[:, None]
+    return ((h * _PERM_A + _PERM_B) % _MERSENNE).min(axis=0)
+
+class SigIndex:
+    """Append-only LSH index of hearing signatures → canonical file lookup.
+
+    Only files listed in *canonical* are loaded.  Signatures are appended
+    before the batch's CSVs, so a killed run can leave lines for files that
+    never reached OUT_CLEAN; those are ignored here and re-added on rerun."""
+    def __init__(self, path: Path, canonical: set):
+        self.path, self.sigs, self.buckets, self.dirty = path, {}, {}, []
+        if path.exists():
+            with path.open() as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:       # line cut short when the run was killed
+                        continue
+                    if rec["File"] in canonical:
+                        self.add(rec["File"], np.array(rec["Sig"], dtype=np.uint64))
+            # terminate a cut-short last line so the next append starts clean
+            with path.open("rb+") as f:
+                size = f.seek(0, 2)
+                if size:
+                    f.seek(-1, 2)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+        self.dirty = []
+
+    def _bands(self, sig):
+        return [f"{b}:{zlib.crc32(sig[b*_ROWS:(b+1)*_ROWS].tobytes())}"
+                for b in range(LSH_BANDS)]
+
+    def query(self, sig):
+        """Return (canonical_file, est_jaccard) of the best match ≥ DUP_THRESH, else None."""
+        cands = {n for key in self._bands(sig) for n in self.buckets.get(key, ())}
+        best = max(((n, float((self.sigs[n] == sig).mean())) for n in cands),
+                   key=lambda t: t[1], default=None)
+        return best if best and best[1] >= DUP_THRESH else None
+
+    def add(self, name, sig):
+        self.sigs[name] = sig
+        for key in self._bands(sig):
+            self.buckets.setdefault(key, []).append(name)
+        self.dirty.append(name)
+
+    def save(self):
+        """Append only the signatures added since the last save."""
+        if self.dirty:
+            with self.path.open("a") as f:
+                for n in self.dirty:
+                    f.write(json.dumps({"File": n, "Sig": self.sigs[n].tolist()}) + "\n")
+            self.dirty = []
+
 # ── STREAM set-up & RERUN guard ─────────────────────
 def _seen(csv_path, col="File"):
     """Return set of filenames already present in a CSV (empty if file absent)."""
     return (set(pd.read_csv(csv_path, usecols=[col])[col])
             if csv_path.exists() and csv_path.stat().st_size else set())
 
-already_done = _seen(OUT_CLEAN) | _seen(OUT_DROP) | _seen(OUT_NO_INT)
+already_done = _seen(OUT_CLEAN) | _seen(OUT_DROP) | _seen(OUT_NO_INT) | _seen(OUT_DUPES)
 log(f"▶ RERUN  |  {len(already_done):,} XMLs already parsed – will be skipped\n")
 
 all_xmls = sorted(p for p in CORPUS_DIR.glob("*.xml")      # add '**/*.xml' if nested
                   if p.name not in already_done)
 log(f"▶ STREAM |  {len(all_xmls):,} XMLs left to process\n")
 
+# canonical = hearings whose rows are in OUT_CLEAN
+sig_index = SigIndex(SIG_INDEX, _seen(OUT_CLEAN))
+log(f"▶ DEDUP  |  {len(sig_index.sigs):,} signatures in index\n")
+
 # ── XML parsing function ──────────────────────────
 def parse_xml_file(fp: Path) -> dict:
     """
@@ -432,6 +513,7 @@ def clean_hearing_from_data(fd):
 
 # ── main processing loop ─────────────────
 first_clean_write = first_drop_write = first_no_intro_write = True
+first_dupe_write = not (OUT_DUPES.exists() and OUT_DUPES.stat().st_size)
 processed = 0
 batch_count = 0
 
@@ -442,7 +524,7 @@ for i in range(0, len(all_xmls), BATCH_SIZE):
     
     log(f"\n{dash}\n▶ BATCH {batch_count}  ({len(batch_files)} files)\n")
     
-    rows, dropped, no_intro = [], [], []
+    rows, dropped, no_intro, dupes = [], [], [], []
     
     for fp in batch_files:
         # Parse XML file
@@ -455,7 +537,20 @@ for i in range(0, len(all_xmls), BATCH_SIZE):
                 "Reason": "XML parse error"
             })
             continue
-            
+
+        # Cheap near-duplicate screen before the regex work
+        sig = minhash(fd["text"])
+        if sig is not None and (hit := sig_index.query(sig)):
+            log(f"[DUPE] {fp.name} ≈ {hit[0]} (J≈{hit[1]:.2f}) – skipped")
+            dupes.append({
+                "File": fp.name,
+                "Date": fd["date"],
+                "HearingTitle": fd["title"],
+                "CanonicalFile": hit[0],
+                "Jaccard": round(hit[1], 3)
+            })
+            continue
+
         # Process the parsed data
         try:
             signal.signal(signal.SIGALRM,
@@ -481,9 +576,12 @@ for i in range(0, len(all_xmls), BATCH_SIZE):
                 "Reason": str(e)
             })
             continue
-            
+
         if r:
             rows.extend(r)
+            # only hearings with rows in OUT_CLEAN become canonical
+            if sig is not None:
+                sig_index.add(fp.name, sig)
         else:
             dropped.append(meta)
             
@@ -495,6 +593,10 @@ for i in range(0, len(all_xmls), BATCH_SIZE):
         # Clear memory after processing each file
         del fd, r, meta
         
+    # Persist new signatures before the CSVs: a kill in between leaves extra
+    # lines (filtered out on load), never a canonical missing from the index
+    sig_index.save()
+
     # Write results incrementally
     if rows:
         df = pd.DataFrame(rows)
@@ -520,12 +622,19 @@ for i in range(0, len(all_xmls), BATCH_SIZE):
         first_no_intro_write = False
         log(f"  • noted {len(no_intro):,} intro-less files")
 
+    if dupes:
+        pd.DataFrame(dupes).to_csv(OUT_DUPES, mode="a", index=False,
+                                   header=first_dupe_write)
+        first_dupe_write = False
+        log(f"  • linked {len(dupes):,} near-duplicates to canonical files")
+
     # Clear batch memory
-    del rows, dropped, no_intro
+    del rows, dropped, no_intro, dupes
     gc.collect()
 
 log(f"\n{dash}")
 log(f"FINISHED – processed {processed:,} XML files")
 log(f"Clean CSV       : {OUT_CLEAN}")
 log(f"Discarded CSV   : {OUT_DROP}")
-log(f"No-intro CSV    : {OUT_NO_INT}")
\ No newline at end of file
+log(f"No-intro CSV    : {OUT_NO_INT}")
+log(f"Duplicates CSV  : {OUT_DUPES}")
\ No newline at end of file